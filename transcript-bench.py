@@ -0,0 +1,790 @@
+#!/usr/bin/env python3
+
+"""
+Transcript-IF benchmark script. This replays GlkOte transcript recordings
+against a transcript-if.py server, for many games at once, while a crowd
+of websocket viewers watches each game. It reports ingest throughput,
+delivery latency to viewers, server CPU time per update, and server
+memory growth.
+
+This script is in the public domain.
+"""
+
+import os, os.path
+import sys
+import time
+import json
+import random
+import asyncio
+import subprocess
+
+import tornado
+import tornado.httpclient
+import tornado.websocket
+import tornado.ioloop
+import tornado.options
+
+tornado.options.define(
+    'url', type=str,
+    help='base URL of a running transcript-if.py server (if not given, launch one)')
+
+tornado.options.define(
+    'port', type=int, default=4001,
+    help='port number for the launched server')
+
+tornado.options.define(
+    'games', type=int, default=10,
+    help='number of games to replay at once')
+
+tornado.options.define(
+    'viewers', type=int, default=2,
+    help='number of websocket viewers per game')
+
+tornado.options.define(
+    'rate', type=float, default=2.0,
+    help='updates per second for each game (0 means as fast as possible)')
+
+tornado.options.define(
+    'inflight', type=int, default=4,
+    help='most unanswered updates each game may have outstanding')
+
+tornado.options.define(
+    'duration', type=float, default=30.0,
+    help='seconds to run the replay (after the warm-up)')
+
+tornado.options.define(
+    'warmup', type=float, default=2.0,
+    help='seconds to run before measuring')
+
+tornado.options.define(
+    'repeat', type=int, default=3,
+    help='number of runs; results are the median across runs')
+
+tornado.options.define(
+    'transcript', type=str, multiple=True,
+    help='JSONL transcript file(s) to replay (default: the synthetic corpus)')
+
+tornado.options.define(
+    'turns', type=int, default=100,
+    help='turns in each synthetic transcript')
+
+tornado.options.define(
+    'seed', type=int, default=1,
+    help='random seed for the synthetic corpus')
+
+tornado.options.define(
+    'dumpcorpus', type=str,
+    help='write the synthetic corpus to this JSONL file and exit')
+
+tornado.options.define(
+    'sample', type=float, default=1.0,
+    help='seconds between server CPU/memory samples')
+
+tornado.options.define(
+    'output', type=str,
+    help='write results to this JSON file')
+
+tornado.options.define(
+    'baseline', type=str,
+    help='compare results against this JSON results file')
+
+tornado.options.define(
+    'threshold', type=float, default=0.20,
+    help='fractional worsening (of the median across runs) which counts as a regression')
+
+tornado.options.define(
+    'label', type=str, default='',
+    help='label to store with the results')
+
+# Parse 'em up.
+tornado.options.parse_command_line()
+opts = tornado.options.options
+
+# Bump this if the results format changes incompatibly.
+RESULTS_FORMAT = 2
+
+# Metrics compared against a baseline. Each entry is a path into a run's
+# results; +1 if bigger is better or -1 if smaller is better; and the
+# smallest absolute worsening which can fail the comparison (on top of
+# --threshold), or None if the metric is only reported. A millisecond of
+# latency is scheduling noise on most machines. Memory growth moves in
+# page-sized steps, so it's too coarse to fail on.
+COMPARE_METRICS = [
+    ('ingest.updates_per_sec', +1, 0),
+    ('ingest.post_latency_ms.p50', -1, 2.0),
+    ('ingest.post_latency_ms.p99', -1, 2.0),
+    ('delivery.latency_ms.p50', -1, 2.0),
+    ('delivery.latency_ms.p99', -1, 2.0),
+    ('delivery.missed', -1, 0),
+    ('cpu.per_update_ms.mean', -1, 0.05),
+    ('cpu.per_update_ms.p99', -1, 0.05),
+    ('memory.growth_per_update', -1, None),
+]
+
+# A p99 from fewer samples than this is mostly the max of a few outliers.
+# We report it, but don't fail on it.
+MIN_TAIL_SAMPLES = 1000
+
+WORDS = (
+    'the a brass lantern small grate dusty rock passage leads north south '
+    'east west up down you are standing at end of road before building '
+    'little stream flows out and down gully forest all around cobbles '
+    'bird cage rod rusty mark star wand debris room low wide hall mists '
+    'there is here nothing happens it is now pitch dark'
+    ).split()
+
+def synthetic_transcript(rng, index, turns):
+    """Generate a synthetic transcript: a list of GlkOte recording
+    payloads, as sent by recording_send() in glkote.js. The game has
+    a one-line status window and a story window. Turns print a few
+    paragraphs; now and then the story window is cleared or the
+    window layout changes.
+    """
+    def sentence():
+        ls = [ rng.choice(WORDS) for ix in range(rng.randint(4, 16)) ]
+        return ' '.join(ls).capitalize() + '.'
+
+    def paragraph():
+        text = ' '.join([ sentence() for ix in range(rng.randint(1, 5)) ])
+        return { 'content': [ { 'style':'normal', 'text':text } ] }
+
+    def windows(width, height):
+        return [
+            { 'id':1, 'type':'grid', 'rock':202,
+              'gridwidth':width//10, 'gridheight':1,
+              'left':0, 'top':0, 'width':width, 'height':20 },
+            { 'id':2, 'type':'buffer', 'rock':201,
+              'left':0, 'top':20, 'width':width, 'height':height-20 },
+        ]
+
+    def statusline(turn):
+        text = ' %s' % (rng.choice(WORDS).capitalize(),)
+        text += ' ' * (60 - len(text)) + 'Turns: %d' % (turn,)
+        return { 'id':1, 'lines': [
+            { 'line':0, 'content': [ { 'style':'normal', 'text':text } ] }
+        ] }
+
+    sid = '%d%04d' % (1000000000000 + index, index)
+    label = 'Synthetic %d' % (index,)
+    timestamp = 1700000000000 + index * 1000000
+    width, height = 800, 600
+
+    res = []
+    for turn in range(turns):
+        gen = turn + 1
+        output = { 'type':'update', 'gen':gen }
+        content = [ statusline(turn) ]
+        if turn == 0:
+            output['windows'] = windows(width, height)
+            textls = [ { 'content': [ { 'style':'header', 'text':label } ] } ]
+            textls.extend([ paragraph() for ix in range(4) ])
+            content.append({ 'id':2, 'text':textls })
+            inputval = None
+        else:
+            if rng.random() < 0.05:
+                width = rng.choice([ 640, 800, 1024 ])
+                output['windows'] = windows(width, height)
+            buf = { 'id':2, 'text':[ paragraph() for ix in range(rng.randint(1, 4)) ] }
+            if rng.random() < 0.05:
+                buf['clear'] = True
+            content.append(buf)
+            inputval = { 'type':'line', 'gen':gen-1, 'window':2,
+                         'value':' '.join(rng.sample(WORDS, 2)) }
+        output['content'] = content
+        output['input'] = [ { 'id':2, 'gen':gen, 'type':'line', 'maxlen':256 } ]
+        timestamp += rng.randint(2000, 20000)
+        res.append({
+            'sessionId':sid, 'label':label, 'format':'glkote',
+            'input':inputval, 'output':output,
+            'timestamp':timestamp, 'outtimestamp':timestamp + rng.randint(1, 50),
+        })
+    return res
+
+def synthetic_corpus(seed, count, turns):
+    rng = random.Random(seed)
+    return [ synthetic_transcript(rng, ix+1, turns) for ix in range(count) ]
+
+def load_transcripts(filename):
+    """Read a JSONL file of recording payloads (one per line, as
+    RecordHandler receives them). Payloads are grouped into transcripts
+    by sessionId, keeping their order in the file.
+    """
+    sessions = {}
+    fl = open(filename)
+    for ln in fl:
+        ln = ln.strip()
+        if not ln:
+            continue
+        state = json.loads(ln)
+        sessions.setdefault(state['sessionId'], []).append(state)
+    fl.close()
+    return list(sessions.values())
+
+def percentiles(ls, scale=1.0):
+    """Summarize a list of numbers as a dict of percentiles (nearest-rank),
+    multiplied by scale. Returns None for an empty list.
+    """
+    if not ls:
+        return None
+    ls = sorted(ls)
+    def rank(frac):
+        return ls[min(len(ls)-1, int(frac * len(ls)))] * scale
+    return {
+        'count': len(ls),
+        'mean': sum(ls) / len(ls) * scale,
+        'p50': rank(0.50),
+        'p90': rank(0.90),
+        'p99': rank(0.99),
+        'max': ls[-1] * scale,
+    }
+
+class GameReplay:
+    """The GameReplay class plays back one transcript, as one game, at
+    the requested rate. It renumbers the session ID and the generation
+    number, so that every update it sends is unique; viewers use the
+    generation number to match deliveries against send times.
+    """
+    def __init__(self, bench, index, transcript):
+        self.bench = bench
+        # Distinct for each run, in case we're reusing a server.
+        self.sid = '9%03d%06d' % (bench.repeat, index,)
+        self.label = 'Bench %d' % (index,)
+        self.transcript = transcript
+
+        self.gen = 0
+        self.sendtimes = {}
+        self.viewers = []
+
+    async def send(self, payload, schedtime):
+        self.gen += 1
+        gen = self.gen
+        state = dict(payload)
+        state['sessionId'] = self.sid
+        state['label'] = self.label
+        state['timestamp'] = int(time.time() * 1000)
+        state['output'] = dict(payload['output'])
+        state['output']['gen'] = gen
+        body = json.dumps(state)
+
+        # Latency counts from when the update was due, not when it
+        # went out, so that time spent queued behind a slow server
+        # shows up.
+        self.sendtimes[gen] = schedtime
+        try:
+            res = await self.bench.client.fetch(
+                self.bench.url + '/record', method='POST', body=body,
+                raise_error=False)
+            code = res.code
+        except OSError:
+            code = None
+        bench = self.bench
+        donetime = time.perf_counter()
+        measured = (schedtime >= bench.measuretime)
+        if code == 200:
+            bench.totalaccepted += 1
+            if measured:
+                bench.updates += 1
+                bench.postlatencies.append(donetime - schedtime)
+            if bench.measuretime <= donetime < bench.deadline:
+                bench.completed += 1
+                bench.bytes += len(body)
+        else:
+            # The server won't pass this one along to viewers.
+            del self.sendtimes[gen]
+            if measured:
+                bench.errors += 1
+
+    async def setup(self):
+        # The first update creates the game on the server. Viewers
+        # can't connect until it exists.
+        await self.send(self.transcript[0], time.perf_counter())
+        self.viewers = [ Viewer(self) for ix in range(opts.viewers) ]
+        await asyncio.gather(*[ viewer.connect() for viewer in self.viewers ])
+        for viewer in self.viewers:
+            viewer.task = asyncio.ensure_future(viewer.listen())
+
+    async def run(self, starttime, deadline):
+        # GlkOte doesn't wait for the recording server to answer, so
+        # neither do we: updates go out on schedule, up to --inflight
+        # at a time. (With --rate=0, we just keep --inflight updates
+        # outstanding.)
+        slots = asyncio.Semaphore(opts.inflight)
+        pending = set()
+        count = 0
+        while True:
+            if opts.rate > 0:
+                schedtime = starttime + count / opts.rate
+                if schedtime >= deadline:
+                    break
+                delay = schedtime - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await slots.acquire()
+            else:
+                await slots.acquire()
+                schedtime = time.perf_counter()
+                if schedtime >= deadline:
+                    break
+            if schedtime >= self.bench.measuretime:
+                self.bench.offered += 1
+            count += 1
+            payload = self.transcript[count % len(self.transcript)]
+            task = asyncio.ensure_future(self.send(payload, schedtime))
+            task.add_done_callback(lambda task: slots.release())
+            task.add_done_callback(pending.discard)
+            pending.add(task)
+        await asyncio.gather(*list(pending))
+
+    def expected(self):
+        # Deliveries we should see: every update accepted after each
+        # viewer connected.
+        return sum([ len([ gen for gen in self.sendtimes if gen > viewer.mingen ]) for viewer in self.viewers ])
+
+class Viewer:
+    """The Viewer class is one websocket viewer of a game. It records
+    the delay between each update being posted and its arrival here.
+    """
+    def __init__(self, replay):
+        self.replay = replay
+        self.conn = None
+        self.task = None
+        self.mingen = 0
+        self.received = 0
+
+    async def connect(self):
+        url = self.replay.bench.url.replace('http', 'ws', 1)
+        self.conn = await tornado.websocket.websocket_connect(
+            url + '/websocket/' + self.replay.sid)
+        # Anything at or below this generation is the "current state of
+        # the world" update, not a fresh delivery.
+        self.mingen = self.replay.gen
+
+    async def listen(self):
+        bench = self.replay.bench
+        while True:
+            msg = await self.conn.read_message()
+            if msg is None:
+                break
+            now = time.perf_counter()
+            gen = json.loads(msg).get('gen', 0)
+            schedtime = self.replay.sendtimes.get(gen)
+            if gen > self.mingen and schedtime is not None:
+                self.received += 1
+                bench.received += 1
+                if schedtime >= bench.measuretime:
+                    bench.latencies.append(now - schedtime)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+        if self.task:
+            self.task.cancel()
+
+class Bench:
+    """The Bench class runs one benchmark and collects its results.
+    """
+    def __init__(self, url, corpus, repeat=0):
+        self.url = url.rstrip('/')
+        self.corpus = corpus
+        self.repeat = repeat
+        self.client = tornado.httpclient.AsyncHTTPClient(
+            max_clients=max(10, opts.games * opts.inflight),
+            force_instance=True)
+
+        # Updates scheduled before this time (the ones which create
+        # the games, and the warm-up) don't count toward the
+        # measurements.
+        self.measuretime = float('inf')
+        self.deadline = float('inf')
+
+        self.offered = 0
+        self.updates = 0
+        self.completed = 0
+        self.totalaccepted = 0
+        self.errors = 0
+        self.bytes = 0
+        self.received = 0
+        self.postlatencies = []
+        self.latencies = []
+
+        # Server-side stats, if the server was run with --benchstats.
+        self.hasstats = True
+        self.cputimes = []
+        self.memsamples = []
+        self.memstart = None
+        self.serverstats = None
+
+    async def wait_for_server(self, proc, timeout=10.0):
+        """Wait for the server to come up. If we launched it, make sure
+        that the server answering is our process, and not something
+        else which already had the port.
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            if proc and proc.poll() is not None:
+                raise Exception('transcript-if.py exited with status %d (is port %d already in use?)' % (proc.returncode, opts.port,))
+            try:
+                if not proc:
+                    await self.client.fetch(self.url + '/record')
+                    return
+                res = await self.client.fetch(self.url + '/benchstats', raise_error=False)
+                if res.code == 200 and json.loads(res.body.decode())['pid'] == proc.pid:
+                    return
+            except (OSError, tornado.httpclient.HTTPClientError):
+                pass
+            if time.perf_counter() > deadline:
+                raise Exception('No server responding at %s' % (self.url,))
+            await asyncio.sleep(0.1)
+
+    async def poll_stats(self, starttime):
+        if not self.hasstats:
+            return
+        polltime = time.perf_counter()
+        res = await self.client.fetch(self.url + '/benchstats', raise_error=False)
+        if res.code != 200:
+            print('Server has no /benchstats (run it with --benchstats); no CPU or memory stats.')
+            self.hasstats = False
+            return
+        stats = json.loads(res.body.decode())
+        self.serverstats = stats
+        self.memsamples.append([ round(time.perf_counter() - starttime, 3), stats['rss'] ])
+        if self.memstart is not None:
+            self.cputimes.extend(stats['cputimes'])
+        elif polltime >= self.measuretime:
+            # The first poll after the warm-up. The CPU times it
+            # returns belong to the warm-up, so we drop them.
+            self.memstart = stats['rss']
+
+    async def run(self, proc=None):
+        await self.wait_for_server(proc)
+
+        starttime = time.perf_counter()
+        await self.poll_stats(starttime)
+        replays = [ GameReplay(self, ix+1, self.corpus[ix % len(self.corpus)]) for ix in range(opts.games) ]
+        await asyncio.gather(*[ replay.setup() for replay in replays ])
+
+        runtime = time.perf_counter()
+        runcputime = time.process_time()
+        self.measuretime = runtime + opts.warmup
+        deadline = self.measuretime + opts.duration
+        self.deadline = deadline
+        # Space the games' start times evenly over one update interval,
+        # so that they don't all post on the same tick.
+        tasks = []
+        for (ix, replay) in enumerate(replays):
+            offset = 0.0
+            if opts.rate > 0:
+                offset = ix / (len(replays) * opts.rate)
+            tasks.append(asyncio.ensure_future(replay.run(runtime + offset, deadline)))
+
+        # Poll the server regularly, and also right at the end of the
+        # warm-up.
+        nextpoll = runtime + opts.sample
+        while not all([ task.done() for task in tasks ]):
+            waketime = nextpoll
+            if self.memstart is None:
+                waketime = min(waketime, self.measuretime)
+            await asyncio.wait(tasks, timeout=max(0, waketime - time.perf_counter()))
+            await self.poll_stats(starttime)
+            while nextpoll <= time.perf_counter():
+                nextpoll += opts.sample
+        for task in tasks:
+            # Raise any exception the replay hit.
+            task.result()
+        ingesttime = time.perf_counter() - self.measuretime
+        # If we're using most of a CPU ourselves, our latency figures
+        # include our own scheduling delays.
+        clientcpu = (time.process_time() - runcputime) / (time.perf_counter() - runtime)
+
+        # Give the last deliveries a moment to arrive.
+        expected = sum([ replay.expected() for replay in replays ])
+        drainlimit = time.perf_counter() + 5.0
+        while self.received < expected and time.perf_counter() < drainlimit:
+            await asyncio.sleep(0.05)
+        await self.poll_stats(starttime)
+
+        for replay in replays:
+            for viewer in replay.viewers:
+                viewer.close()
+        self.client.close()
+
+        return self.results(ingesttime, expected, clientcpu)
+
+    def results(self, ingesttime, expected, clientcpu):
+        # Offered and achieved rates cover the same window: the
+        # --duration after the warm-up. Offered counts updates due in
+        # it; achieved counts replies received in it. So a server which
+        # falls behind achieves less than it was offered.
+        res = {
+            'client': {
+                'cpu_util': clientcpu,
+            },
+            'ingest': {
+                'offered': self.offered,
+                'updates': self.updates,
+                'errors': self.errors,
+                'completed': self.completed,
+                'total_accepted': self.totalaccepted,
+                'seconds': round(ingesttime, 3),
+                'offered_per_sec': self.offered / opts.duration,
+                'updates_per_sec': self.completed / opts.duration,
+                'bytes_per_sec': self.bytes / opts.duration,
+                'post_latency_ms': percentiles(self.postlatencies, 1000.0),
+            },
+            'delivery': {
+                'expected': expected,
+                'received': self.received,
+                'missed': expected - self.received,
+                'latency_ms': percentiles(self.latencies, 1000.0),
+            },
+            'server': None,
+            'cpu': None,
+            'memory': None,
+        }
+
+        if self.serverstats:
+            # What the server saw, to check against what we sent.
+            res['server'] = {
+                'updates': self.serverstats['updates'],
+                'games': self.serverstats['games'],
+                'conns': self.serverstats['conns'],
+            }
+
+        if self.hasstats and self.cputimes:
+            res['cpu'] = {
+                'updates': len(self.cputimes),
+                'total_ms': sum(self.cputimes) * 1000.0,
+                'per_update_ms': percentiles(self.cputimes, 1000.0),
+            }
+        if self.hasstats and self.memstart is not None:
+            rssls = [ rss for (tm, rss) in self.memsamples ]
+            growth = rssls[-1] - self.memstart
+            res['memory'] = {
+                'start': self.memstart,
+                'end': rssls[-1],
+                'peak': max(rssls),
+                'growth': growth,
+                'growth_per_update': growth / max(1, self.updates),
+                'samples': self.memsamples,
+            }
+        return res
+
+def lookup(res, path):
+    for key in path.split('.'):
+        if not isinstance(res, dict):
+            return None
+        res = res.get(key)
+    return res
+
+def print_results(res):
+    def fmt(val, units=''):
+        if val is None:
+            return '-'
+        return '%.3f%s' % (val, units)
+
+    ingest = res['ingest']
+    print('Ingest: %d of %d updates accepted (%d errors), last reply after %.1f s: offered %.1f updates/s, achieved %.1f updates/s, %.1f KB/s'
+          % (ingest['updates'], ingest['offered'], ingest['errors'],
+             ingest['seconds'], ingest['offered_per_sec'],
+             ingest['updates_per_sec'], ingest['bytes_per_sec'] / 1024))
+    for (title, path) in [
+            ('POST latency', 'ingest.post_latency_ms'),
+            ('Delivery latency', 'delivery.latency_ms'),
+            ('CPU per update', 'cpu.per_update_ms') ]:
+        dist = lookup(res, path)
+        if not dist:
+            print('%s: no data' % (title,))
+            continue
+        print('%s: mean %s, p50 %s, p90 %s, p99 %s, max %s'
+              % (title, fmt(dist['mean'], 'ms'), fmt(dist['p50'], 'ms'),
+                 fmt(dist['p90'], 'ms'), fmt(dist['p99'], 'ms'),
+                 fmt(dist['max'], 'ms')))
+    print('Client CPU: %.0f%% of one core' % (res['client']['cpu_util'] * 100,))
+    if res['client']['cpu_util'] > 0.5:
+        print('Warning: the benchmark client is busy; latency figures will be noisy.')
+    delivery = res['delivery']
+    print('Deliveries: %d of %d received' % (delivery['received'], delivery['expected']))
+    server = res['server']
+    if server:
+        print('Server saw: %d updates (we sent %d, counting setup and warm-up), %d games, %d viewers'
+              % (server['updates'], ingest['total_accepted'], server['games'], server['conns']))
+    memory = res['memory']
+    if memory:
+        print('Server memory: %.1f MB -> %.1f MB (peak %.1f MB), %.0f bytes per update'
+              % (memory['start'] / 1048576, memory['end'] / 1048576,
+                 memory['peak'] / 1048576, memory['growth_per_update']))
+
+def tail_count_path(path):
+    # The sample count which goes with a p99 metric, or None.
+    if path.endswith('.p99'):
+        return path[:-len('p99')] + 'count'
+    return None
+
+def summarize(runs):
+    """Reduce a list of run results to one value per compared metric:
+    the median across the runs. For sample counts, take the smallest.
+    """
+    summary = {}
+    for (path, sign, floor) in COMPARE_METRICS:
+        ls = [ lookup(run, path) for run in runs ]
+        ls = sorted([ val for val in ls if val is not None ])
+        if ls:
+            mid = len(ls) // 2
+            if len(ls) % 2:
+                summary[path] = ls[mid]
+            else:
+                summary[path] = (ls[mid-1] + ls[mid]) / 2
+        countpath = tail_count_path(path)
+        if countpath:
+            ls = [ lookup(run, countpath) for run in runs ]
+            if None not in ls:
+                summary[countpath] = min(ls)
+    return summary
+
+def compare_results(res, baseline):
+    """Print each compared metric (median across runs) against the
+    baseline. Return the number of checked metrics which got worse by
+    more than the threshold, and by more than the metric's floor.
+    """
+    if baseline.get('format') != RESULTS_FORMAT:
+        print('Baseline has results format %s; expected %s.' % (baseline.get('format'), RESULTS_FORMAT))
+        return 0
+    if baseline.get('params') != res['params']:
+        print('Warning: baseline was run with different parameters:')
+        print('  %s' % (json.dumps(baseline.get('params'), sort_keys=True),))
+
+    oldsummary = baseline['summary']
+    newsummary = res['summary']
+    regressions = 0
+    print('%-30s %12s %12s %9s' % ('metric', 'baseline', 'current', 'change'))
+    for (path, sign, floor) in COMPARE_METRICS:
+        oldval = oldsummary.get(path)
+        newval = newsummary.get(path)
+        if oldval is None or newval is None:
+            continue
+        gate = (floor is not None)
+        note = '(worse; not checked)'
+        countpath = tail_count_path(path)
+        if gate and countpath:
+            counts = [ oldsummary.get(countpath), newsummary.get(countpath) ]
+            if None in counts or min(counts) < MIN_TAIL_SAMPLES:
+                gate = False
+                note = '(worse; too few samples to check)'
+        worsening = -sign * (newval - oldval)
+        if oldval:
+            change = (newval - oldval) / abs(oldval)
+            worse = (worsening > abs(oldval) * opts.threshold)
+            changestr = '%+8.1f%%' % (change*100,)
+        else:
+            # No relative change from zero; any worsening counts.
+            worse = (worsening > 0)
+            changestr = '%9s' % ('-',)
+        if gate and worsening <= floor:
+            worse = False
+        flag = ''
+        if worse and gate:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif worse:
+            flag = note
+        print('%-30s %12.3f %12.3f %s %s' % (path, oldval, newval, changestr, flag))
+    return regressions
+
+def launch_server():
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    args = [ sys.executable, 'transcript-if.py',
+             '--port=%d' % (opts.port,), '--benchstats',
+             '--logging=warning' ]
+    # The server prints every update it receives; that's part of its
+    # real cost, but we don't need to see it.
+    return subprocess.Popen(args, cwd=dirname,
+                            stdout=subprocess.DEVNULL)
+
+def main():
+    if opts.dumpcorpus:
+        corpus = synthetic_corpus(opts.seed, max(1, opts.games), opts.turns)
+        fl = open(opts.dumpcorpus, 'w')
+        for transcript in corpus:
+            for state in transcript:
+                fl.write(json.dumps(state) + '\n')
+        fl.close()
+        return 0
+
+    if opts.transcript:
+        corpus = []
+        for filename in opts.transcript:
+            corpus.extend(load_transcripts(filename))
+    else:
+        corpus = synthetic_corpus(opts.seed, max(1, opts.games), opts.turns)
+    if not corpus:
+        raise Exception('No transcripts to replay')
+
+    url = opts.url
+    if not url:
+        url = 'http://localhost:%d' % (opts.port,)
+
+    runs = []
+    for repeat in range(max(1, opts.repeat)):
+        # Each run gets a fresh server, if we're launching one.
+        proc = None
+        if not opts.url:
+            proc = launch_server()
+        try:
+            bench = Bench(url, corpus, repeat)
+            run = tornado.ioloop.IOLoop.current().run_sync(lambda: bench.run(proc))
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+        print('Run %d of %d:' % (repeat+1, max(1, opts.repeat)))
+        print_results(run)
+        runs.append(run)
+
+    summary = summarize(runs)
+    if len(runs) > 1:
+        print('Median of %d runs:' % (len(runs),))
+        for (path, sign, floor) in COMPARE_METRICS:
+            if path in summary:
+                print('  %-30s %12.3f' % (path, summary[path]))
+
+    res = {
+        'format': RESULTS_FORMAT,
+        'label': opts.label,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'tornado': tornado.version,
+        'params': {
+            'games': opts.games,
+            'viewers': opts.viewers,
+            'rate': opts.rate,
+            'inflight': opts.inflight,
+            'duration': opts.duration,
+            'warmup': opts.warmup,
+            'repeat': max(1, opts.repeat),
+            'transcript': list(opts.transcript or []),
+            'turns': opts.turns,
+            'seed': opts.seed,
+        },
+        'corpus': {
+            'transcripts': len(corpus),
+            'updates': sum([ len(ls) for ls in corpus ]),
+        },
+        'summary': summary,
+        'runs': runs,
+    }
+
+    if opts.output:
+        fl = open(opts.output, 'w')
+        json.dump(res, fl, indent=1, sort_keys=True)
+        fl.write('\n')
+        fl.close()
+
+    if opts.baseline:
+        fl = open(opts.baseline)
+        baseline = json.load(fl)
+        fl.close()
+        if compare_results(res, baseline):
+            return 1
+    return 0
+
+sys.exit(main())
@@ -9,6 +9,8 @@ Written by Andrew Plotkin. This script is in the public domain.
 
 import logging
 import os
+import sys
+import time
 import json
 
 import tornado.web
@@ -25,6 +27,10 @@ tornado.options.define(
     'debug', type=bool,
     help='application debugging (see Tornado docs)')
 
+tornado.options.define(
+    'benchstats', type=bool,
+    help='collect CPU and memory stats for transcript-bench.py')
+
 # Parse 'em up.
 tornado.options.parse_command_line()
 opts = tornado.options.options
@@ -88,6 +94,10 @@ class RecordHandler(tornado.web.RequestHandler):
         
     @tornado.gen.coroutine
     def post(self):
+        benchstats = self.application.benchstats
+        if benchstats is not None:
+            starttime = time.process_time()
+        
         state = json.loads(self.request.body.decode())
         
         # We use json.dumps as an easy way to pretty-print the object
@@ -185,6 +195,30 @@ class RecordHandler(tornado.web.RequestHandler):
         # update). This is ignored, actually.
         self.write('Ok')
 
+        if benchstats is not None:
+            benchstats.append(time.process_time() - starttime)
+
+class BenchStatsHandler(tornado.web.RequestHandler):
+    # Handle the "/benchstats" URL: CPU and memory stats for
+    # transcript-bench.py. Only present with the --benchstats option.
+
+    @tornado.gen.coroutine
+    def get(self):
+        app = self.application
+        # Hand over the per-update CPU times collected since the last
+        # request, and start a fresh list.
+        cputimes = app.benchstats
+        app.benchstats = []
+        app.benchupdates += len(cputimes)
+        self.write({
+            'pid': os.getpid(),
+            'rss': current_rss(),
+            'games': len(app.games),
+            'conns': len(app.conns),
+            'updates': app.benchupdates,
+            'cputimes': cputimes,
+        })
+
 class SocketHandler(tornado.websocket.WebSocketHandler):
     # Handle the "/websocket/SID" URL: websocket connections
     
@@ -258,6 +292,23 @@ class Connection:
         self.id = None
         self.sid = None
         self.sock = None
+
+def current_rss():
+    """Return the resident memory size of this process, in bytes.
+    """
+    try:
+        fl = open('/proc/self/statm')
+        pages = int(fl.read().split()[1])
+        fl.close()
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # No /proc (not Linux). Fall back to the peak size, which
+        # getrusage reports in kilobytes on Linux but bytes on MacOS.
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return maxrss
+        return maxrss * 1024
         
 # Core handlers.
 handlers = [
@@ -268,6 +319,9 @@ handlers = [
     (r'/websocket/([0-9]+)', SocketHandler),
 ]
 
+if opts.benchstats:
+    handlers.append( (r'/benchstats', BenchStatsHandler) )
+
 class MyApplication(tornado.web.Application):
     """MyApplication is a customization of the generic Tornado web app
     class.
@@ -280,6 +334,11 @@ class MyApplication(tornado.web.Application):
         self.games = {}
         # Connection repository; maps connection ID to connection objects
         self.conns = {}
+
+        # Per-update CPU times for RecordHandler.post, if we're
+        # collecting them. (BenchStatsHandler empties this list.)
+        self.benchstats = [] if opts.benchstats else None
+        self.benchupdates = 0
         
     def create_connection(self, sid, sock):
         conn = Connection(sid, sock)